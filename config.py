@@ -1,16 +1,57 @@
 import os
+import functools
 from dotenv import load_dotenv
 
-load_dotenv()
+@functools.lru_cache(maxsize=1)
+def _ensure_env_loaded() -> bool:
+    """Parses the .env file once per process, no matter how often config is imported."""
+    return load_dotenv()
+
+_ensure_env_loaded()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-large-latest")
+MISTRAL_EMBED_MODEL = os.getenv("MISTRAL_EMBED_MODEL", "mistral-embed")
+# Text messages arriving within this window are sent to Mistral as one batch (0 disables batching)
+MISTRAL_BATCH_WINDOW_MS = int(os.getenv("MISTRAL_BATCH_WINDOW_MS", "25"))
+MISTRAL_BATCH_SIZE = int(os.getenv("MISTRAL_BATCH_SIZE", "8"))
+
+# Semantic cache of text-message results
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
 
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
 GOOGLE_TOKEN_FILE = os.getenv("GOOGLE_TOKEN_FILE", "token.json")
+GOOGLE_CREDENTIALS_JSON = os.getenv("GOOGLE_CREDENTIALS_JSON")
 GOOGLE_SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Deployment
+APP_URL = os.getenv("APP_URL")
+PORT = int(os.getenv("PORT", "8080"))
+DATABASE_URL = os.getenv("DATABASE_URL")
+# Number of bot processes serving webhooks on the same PORT
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Optional; shares pending OAuth states and credential invalidations between workers
+REDIS_URL = os.getenv("REDIS_URL")
+# In-process cache of users' Google credentials in front of the database. Without Redis,
+# other workers can't be told about a disconnect or refresh, so entries must expire quickly
+CREDS_CACHE_SIZE = int(os.getenv("CREDS_CACHE_SIZE", "10000"))
+CREDS_CACHE_TTL_SECONDS = int(os.getenv("CREDS_CACHE_TTL_SECONDS") or (300 if REDIS_URL or WEB_WORKERS == 1 else 5))
+OAUTH_STATE_TTL_SECONDS = int(os.getenv("OAUTH_STATE_TTL_SECONDS", "600"))
+
 MAX_AUDIO_DURATION_SECONDS = int(os.getenv("MAX_AUDIO_DURATION_SECONDS", "60"))
+# Set when every voice note is known to be in one language; None lets Whisper detect it
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE") or None
+# English-only checkpoints are faster at the same size, so use one when the language is known English
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE") or ("tiny.en" if WHISPER_LANGUAGE == "en" else "tiny")
+# Leave one core free for the event loop; the encoder scales up to the physical core count
+WHISPER_N_THREADS = int(os.getenv("WHISPER_N_THREADS") or max(1, (os.cpu_count() or 1) - 1))
+# Number of voice notes transcribed concurrently
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "2"))
+# Speech chunks of one voice note encoded together by the batched pipeline
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
 MAX_IMAGE_SIZE_MB = int(os.getenv("MAX_IMAGE_SIZE_MB", "5"))
\ No newline at end of file
@@ -1,12 +1,26 @@
-import os
+import io
+import asyncio
 import logging
-import tempfile
-from typing import Optional
-from pywhispercpp.model import Model
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union, BinaryIO
+import numpy as np
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+
+from config import (
+    WHISPER_LANGUAGE, WHISPER_MODEL_SIZE, WHISPER_N_THREADS, WHISPER_WORKERS, WHISPER_BATCH_SIZE,
+    MAX_AUDIO_DURATION_SECONDS
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Silero VAD settings used to drop silent regions before they reach the encoder
+VAD_PARAMETERS = {"min_silence_duration_ms": 500}
+
+# CTranslate2 releases the GIL while it runs, so worker threads transcribe in parallel
+# without loading a copy of the model per process
+_executor = ThreadPoolExecutor(max_workers=WHISPER_WORKERS, thread_name_prefix="whisper")
+
 class AudioProcessor:
     _instance = None
     
@@ -15,57 +29,133 @@ class AudioProcessor:
         if cls._instance is None:
             cls._instance = super(AudioProcessor, cls).__new__(cls)
             cls._instance.model = None
+            cls._instance.pipeline = None
         return cls._instance
     
-    def load_model(self, model_size: str = "tiny"):
+    def load_model(self, model_size: str = WHISPER_MODEL_SIZE):
         """
-        Loads the Whisper model.
+        Loads the Whisper model using the faster-whisper (CTranslate2) backend.
         
         Args:
-            model_size: Size of the model ('tiny', 'base', 'small', 'medium', 'large')
+            model_size: Size of the model ('tiny', 'base', 'small', 'medium', 'large'), or an
+                English-only distilled checkpoint ('distil-small.en', 'distil-medium.en',
+                'distil-large-v3')
         """
         try:
-            logger.info(f"Loading Whisper.cpp model: {model_size}")
-            self.model = Model(model_size, n_threads=2)
-            logger.info("Whisper.cpp model loaded successfully")
+            logger.info(f"Loading faster-whisper model: {model_size}")
+            # int8 weights keep the CPU matmuls quantized end to end
+            self.model = WhisperModel(
+                model_size,
+                device="cpu",
+                compute_type="int8",
+                cpu_threads=WHISPER_N_THREADS,
+                num_workers=WHISPER_WORKERS
+            )
+            # Encodes the speech chunks found by the VAD as one batch instead of one window at a time
+            self.pipeline = BatchedInferencePipeline(model=self.model)
+            logger.info("faster-whisper model loaded successfully")
             return True
         except Exception as e:
-            logger.error(f"Error loading Whisper.cpp model: {str(e)}")
+            logger.error(f"Error loading faster-whisper model: {str(e)}")
             return False
     
-    def ensure_model_loaded(self, model_size: str = "tiny"):
+    def ensure_model_loaded(self, model_size: str = WHISPER_MODEL_SIZE):
         """Ensures the model is loaded before transcription."""
         if self.model is None:
             return self.load_model(model_size)
         return True
     
-    def transcribe_audio(self, audio_file_path: str, language: Optional[str] = None) -> Optional[str]:
+    def warmup(self):
+        """
+        Runs one throwaway transcription of a second of silence so CTranslate2 allocates its
+        buffers now rather than on the first user's voice note. VAD is off and the language is
+        fixed, otherwise the silence would be dropped before reaching the encoder.
+        """
+        if not self.ensure_model_loaded():
+            return
+        try:
+            silence = np.zeros(self.model.feature_extractor.sampling_rate, dtype=np.float32)
+            segments, _ = self.model.transcribe(
+                silence, language=WHISPER_LANGUAGE or "en", vad_filter=False, beam_size=1
+            )
+            # Segments are generated lazily; consuming them runs the encoder and decoder
+            for _ in segments:
+                pass
+            logger.info("faster-whisper model warmed up")
+        except Exception as e:
+            logger.warning(f"faster-whisper warmup failed: {str(e)}")
+    
+    def decode(self, audio: Union[str, bytes, bytearray, BinaryIO]) -> np.ndarray:
         """
-        Transcribes audio file to text.
+        Decodes audio to 16 kHz mono float32 PCM, capped at the configured duration.
         
         Args:
-            audio_file_path: Path to the audio file
-            language: Optional language code (e.g., 'es', 'fr', 'en')
+            audio: Path to the audio file, raw encoded bytes or an in-memory file-like object
+            
+        Returns:
+            np.ndarray: Decoded audio samples
+        """
+        if isinstance(audio, (bytes, bytearray)):
+            audio = io.BytesIO(audio)
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        samples = decode_audio(audio, sampling_rate=sampling_rate)
+        
+        max_samples = MAX_AUDIO_DURATION_SECONDS * sampling_rate
+        if len(samples) > max_samples:
+            logger.warning(f"Audio longer than {MAX_AUDIO_DURATION_SECONDS}s, truncating")
+            samples = samples[:max_samples]
+        return samples
+    
+    def transcribe_audio(self, audio: Union[str, bytes, bytearray, BinaryIO], language: Optional[str] = None) -> Optional[str]:
+        """
+        Transcribes audio to text.
+        
+        Args:
+            audio: Path to the audio file, raw encoded bytes or an in-memory file-like object
+            language: Optional language code (e.g., 'es', 'fr', 'en'), defaults to WHISPER_LANGUAGE
             
         Returns:
             Optional[str]: Transcribed text or None if failed
         """
+        language = language or WHISPER_LANGUAGE
         if not self.ensure_model_loaded():
-            logger.error("Could not load Whisper.cpp model")
+            logger.error("Could not load faster-whisper model")
             return None
         
         try:
-            options = {}
-            if language:
-                options["language"] = language
+            logger.info("Transcribing audio")
+            # Decode once up front; VAD and the encoder then work on the in-memory samples
+            samples = self.decode(audio)
             
-            logger.info(f"Transcribing audio file: {audio_file_path}")
-            segments = self.model.transcribe(audio_file_path, **options)
+            # Greedy decoding is plenty for short voice notes. Only the speech regions found
+            # by the VAD are transcribed, batched through the encoder together.
+            segments, _ = self.pipeline.transcribe(
+                samples,
+                language=language,
+                vad_filter=True,
+                vad_parameters=VAD_PARAMETERS,
+                beam_size=1,
+                batch_size=WHISPER_BATCH_SIZE
+            )
             
-            transcribed_text = " ".join([segment.text for segment in segments]).strip()
+            transcribed_text = " ".join(segment.text for segment in segments).strip()
             
             logger.info(f"Transcription successful: {transcribed_text[:30]}...")
             return transcribed_text
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+    
+    async def transcribe_audio_async(self, audio: Union[str, bytes, bytearray, BinaryIO], language: Optional[str] = None) -> Optional[str]:
+        """
+        Transcribes audio to text on the Whisper worker pool, keeping the event loop free.
+        
+        Args:
+            audio: Path to the audio file, raw encoded bytes or an in-memory file-like object
+            language: Optional language code (e.g., 'es', 'fr', 'en')
+            
+        Returns:
+            Optional[str]: Transcribed text or None if failed
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, self.transcribe_audio, audio, language)
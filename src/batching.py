@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, Tuple, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class MessageBatcher(Generic[T, R]):
+    """
+    Coalesces items submitted within a short window into a single batch call.
+    
+    Each caller awaits its own result; the batch function receives the items in
+    submission order and must return one result per item, in the same order. Items are
+    only batched with others submitted under the same key, e.g. the same user, so one
+    caller's input never shares a batch call with another's.
+    """
+    
+    def __init__(self, process_batch: Callable[[List[T]], Awaitable[List[R]]],
+                 max_batch: int = 8, window_ms: int = 25):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Flush tasks are referenced here so they aren't garbage-collected mid-batch
+        self._pending: Set[asyncio.Task] = set()
+    
+    async def submit(self, item: T, key: Hashable = None) -> R:
+        """
+        Queues an item for the next batch and waits for its result.
+        
+        Args:
+            item: Item to process
+            key: Only items with an equal key are processed in the same batch
+            
+        Returns:
+            The result the batch function produced for this item
+        """
+        if self._queue is None:
+            # Created lazily so the queue belongs to the running event loop
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # A restarted collector picks up whatever is still on the same queue
+            self._worker = asyncio.create_task(self._collect())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, item, future))
+        return await future
+    
+    async def _collect(self):
+        """Gathers queued items into batches of up to max_batch, waiting at most one window."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            try:
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # Flush in the background so the next batch can start filling right away;
+                # on cancellation this still flushes the partially collected batch
+                self._start_flushes(batch)
+    
+    def _start_flushes(self, entries: List[Tuple[Hashable, T, asyncio.Future]]):
+        """Splits collected entries by key and starts one flush per key, in submission order."""
+        groups: Dict[Hashable, List[Tuple[T, asyncio.Future]]] = {}
+        for key, item, future in entries:
+            groups.setdefault(key, []).append((item, future))
+        for group in groups.values():
+            self._start_flush(group)
+    
+    def _start_flush(self, batch: List[Tuple[T, asyncio.Future]]):
+        """Starts a background flush of a batch and keeps a reference until it finishes."""
+        task = asyncio.create_task(self._flush(batch))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+    
+    async def _flush(self, batch: List[Tuple[T, asyncio.Future]]):
+        """Runs the batch function and routes each result back to its caller."""
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(items)}: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def close(self):
+        """Stops the background collector task and finishes every queued and in-flight batch."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        
+        if self._queue is not None:
+            leftover = []
+            while not self._queue.empty():
+                leftover.append(self._queue.get_nowait())
+            for start in range(0, len(leftover), self.max_batch):
+                self._start_flushes(leftover[start:start + self.max_batch])
+        
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
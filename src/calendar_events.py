@@ -1,77 +1,181 @@
+import asyncio
 import datetime
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from urllib.parse import urlencode, quote
+
+import httpx
+import orjson
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 from src import database
+from src.http_client import HTTP_CLIENT
 
 logger = logging.getLogger(__name__)
 
-def create_event_with_creds(creds: Credentials, event_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+CALENDAR_TIMEZONE = 'America/Santiago'  # This could be made user-configurable
+CALENDAR_TEMPLATE_URL = "https://calendar.google.com/calendar/render?action=TEMPLATE"
+CALENDAR_EVENTS_URL = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
+# Constant part of every template link; only the encoded event fields are appended per call
+_CALENDAR_LINK_PREFIX = CALENDAR_TEMPLATE_URL + "&"
+
+def _to_calendar_link_time(dt: datetime.datetime) -> str:
+    """Formats a datetime the way the Google Calendar template link expects it."""
+    if dt.tzinfo:
+        return dt.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+def generate_calendar_link(event_data: Dict[str, Any]) -> str:
     """
-    Creates an event in Google Calendar using provided user credentials.
-    It also handles token refresh and saves the new token if necessary.
+    Generates a Google Calendar link that opens a prefilled "add event" page.
 
     Args:
-        creds: Google OAuth2 credentials object for the user.
         event_data: Dictionary with event details extracted by Mistral.
-        user_id: The user's ID to save refreshed tokens.
 
     Returns:
-        A dictionary with the result of the operation.
+        The URL-encoded calendar link.
+    """
+    params = {
+        'text': event_data.get('summary'),
+        'details': event_data.get('description'),
+        'location': event_data.get('location'),
+    }
+
+    start_time = event_data.get('start_time')
+    if start_time:
+        try:
+            start_dt = datetime.datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            end_time = event_data.get('end_time')
+            if end_time:
+                end_dt = datetime.datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+            else:
+                end_dt = start_dt + datetime.timedelta(hours=1)
+            params['dates'] = f"{_to_calendar_link_time(start_dt)}/{_to_calendar_link_time(end_dt)}"
+            params['ctz'] = CALENDAR_TIMEZONE
+        except ValueError:
+            # The times come from the model; a malformed one still gets a link the user can fill in
+            logger.warning(f"Ignoring unparseable event times: {start_time!r}, {event_data.get('end_time')!r}")
+
+    # urlencode escapes spaces, '&' and the like in free-text fields in one pass
+    return _CALENDAR_LINK_PREFIX + urlencode({k: v for k, v in params.items() if v}, safe='/', quote_via=quote)
+
+_EXPIRED_MESSAGE = "Your authorization has expired. Please use /disconnect and /connect again."
+_INVALID_MESSAGE = "Your credentials are not valid. Please connect your calendar."
+
+def _build_event_body(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the Calendar API event resource from the extracted event details."""
+    event = {
+        'summary': event_data.get('summary', 'Untitled Event'),
+        'location': event_data.get('location', ''),
+        'description': event_data.get('description', ''),
+        'start': {
+            'dateTime': event_data.get('start_time'),
+            'timeZone': CALENDAR_TIMEZONE,
+        },
+        'end': {
+            'dateTime': event_data.get('end_time'),
+            'timeZone': CALENDAR_TIMEZONE,
+        },
+        'reminders': {'useDefault': True},
+    }
+
+    if not event_data.get('end_time') and event_data.get('start_time'):
+        start_dt = datetime.datetime.fromisoformat(event_data['start_time'].replace('Z', '+00:00'))
+        end_dt = start_dt + datetime.timedelta(hours=1)
+        event['end']['dateTime'] = end_dt.isoformat()
+
+    return event
+
+def _refresh_creds(creds: Credentials, user_id: str, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Refreshes expired credentials in place; the caller saves them.
+
+    Args:
+        creds: Google OAuth2 credentials object for the user.
+        user_id: The user's ID, for logging.
+        force: Refresh even if the credentials look valid, e.g. after Google rejected them.
+
+    Returns:
+        None if the credentials are usable, otherwise the failure result to return.
     """
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            logger.info(f"Credentials for user {user_id} have expired. Refreshing...")
-            try:
-                creds.refresh(Request())
-                database.save_creds(user_id, creds)
-                logger.info(f"Successfully refreshed and saved credentials for user {user_id}")
-            except Exception as e:
-                logger.error(f"Error refreshing credentials for user {user_id}: {e}")
-                return {"success": False, "message": "Your authorization has expired. Please use /disconnect and /connect again."}
-        else:
-            return {"success": False, "message": "Your credentials are not valid. Please connect your calendar."}
+    if creds and creds.valid and not force:
+        return None
+    if not (creds and (creds.expired or force) and creds.refresh_token):
+        return {"success": False, "message": _INVALID_MESSAGE}
 
+    logger.info(f"Credentials for user {user_id} have expired. Refreshing...")
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        
-        event = {
-            'summary': event_data.get('summary', 'Untitled Event'),
-            'location': event_data.get('location', ''),
-            'description': event_data.get('description', ''),
-            'start': {
-                'dateTime': event_data.get('start_time'),
-                'timeZone': 'America/Santiago',  # This could be made user-configurable
-            },
-            'end': {
-                'dateTime': event_data.get('end_time'),
-                'timeZone': 'America/Santiago',
-            },
-            'reminders': {'useDefault': True},
-        }
-
-        if not event_data.get('end_time') and event_data.get('start_time'):
-            start_dt = datetime.datetime.fromisoformat(event_data['start_time'].replace('Z', '+00:00'))
-            end_dt = start_dt + datetime.timedelta(hours=1)
-            event['end']['dateTime'] = end_dt.isoformat()
-
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
-        
-        return {
-            "success": True,
-            "message": "Event created successfully.",
-            "event_id": created_event.get('id'),
-            "event_link": created_event.get('htmlLink')
-        }
-
-    except HttpError as error:
-        logger.error(f"An error occurred for user {user_id}: {error}")
+        creds.refresh(Request())
+        logger.info(f"Successfully refreshed credentials for user {user_id}")
+        return None
+    except Exception as e:
+        logger.error(f"Error refreshing credentials for user {user_id}: {e}")
+        return {"success": False, "message": _EXPIRED_MESSAGE}
+
+def _created_result(created_event: Dict[str, Any]) -> Dict[str, Any]:
+    """Wraps a created Calendar event resource in the result the bot expects."""
+    return {
+        "success": True,
+        "message": "Event created successfully.",
+        "event_id": created_event.get('id'),
+        "event_link": created_event.get('htmlLink')
+    }
+
+async def _insert_event(creds: Credentials, event_data: Dict[str, Any], user_id: str,
+                        retry_unauthorized: bool = True) -> Dict[str, Any]:
+    """Posts the event to the user's primary calendar over the shared HTTP client."""
+    try:
+        response = await HTTP_CLIENT.post(
+            CALENDAR_EVENTS_URL,
+            content=orjson.dumps(_build_event_body(event_data)),
+            headers={"Authorization": f"Bearer {creds.token}", "Content-Type": "application/json"}
+        )
+        if response.status_code == 401 and retry_unauthorized:
+            # The access token was revoked or expired without us knowing; refresh it and retry once
+            logger.info(f"Calendar rejected the access token for user {user_id}. Refreshing...")
+            return await _refresh_and_insert(creds, event_data, user_id, force=True)
+        response.raise_for_status()
+        return _created_result(orjson.loads(response.content))
+
+    except httpx.HTTPStatusError as error:
+        logger.error(f"An error occurred for user {user_id}: {error} {error.response.text}")
         return {"success": False, "message": f"Failed to create event: {error}"}
     except Exception as e:
         logger.error(f"An unexpected error occurred for user {user_id}: {e}")
-        return {"success": False, "message": "An unexpected error occurred."}
\ No newline at end of file
+        return {"success": False, "message": "An unexpected error occurred."}
+
+async def _refresh_and_insert(creds: Credentials, event_data: Dict[str, Any], user_id: str,
+                              force: bool = False) -> Dict[str, Any]:
+    """
+    Refreshes the credentials on a worker thread, then inserts the event while the new
+    token is being saved; the insert only needs the access token, not the database write.
+    """
+    failure = await asyncio.to_thread(_refresh_creds, creds, user_id, force)
+    if failure:
+        return failure
+
+    result, _ = await asyncio.gather(
+        _insert_event(creds, event_data, user_id, retry_unauthorized=False),
+        asyncio.to_thread(database.save_creds, user_id, creds),
+    )
+    return result
+
+async def create_event_async(creds: Credentials, event_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """
+    Creates an event in Google Calendar over the shared pooled HTTP/2 client.
+    Credentials are refreshed when they have expired or when Google rejects them with a
+    401, and a refreshed token is saved while the event is being inserted.
+
+    Args:
+        creds: Google OAuth2 credentials object for the user.
+        event_data: Dictionary with event details extracted by Mistral.
+        user_id: The user's ID to save refreshed tokens.
+
+    Returns:
+        A dictionary with the result of the operation.
+    """
+    if creds and creds.valid:
+        return await _insert_event(creds, event_data, user_id)
+    return await _refresh_and_insert(creds, event_data, user_id)
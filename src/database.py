@@ -1,30 +1,134 @@
-import os
-import json
-from sqlalchemy import create_engine, Column, String, Text, MetaData, Table
-from sqlalchemy.orm import sessionmaker
+import orjson
+import ormsgpack
+from sqlalchemy import create_engine, inspect, select, text, Column, String, Text, LargeBinary, Float, MetaData, Table, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
+import time
+import uuid
+from datetime import datetime
 import logging
+import threading
+from typing import List
+from cachetools import TTLCache
 from google.oauth2.credentials import Credentials
 
+from config import DATABASE_URL, REDIS_URL, CREDS_CACHE_SIZE, CREDS_CACHE_TTL_SECONDS
+
 logger = logging.getLogger(__name__)
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
 engine = None
-SessionLocal = None
+upsert_token_stmt = None
+select_token_stmt = None
+delete_token_stmt = None
+upsert_cache_stmt = None
+select_cache_stmt = None
+purge_cache_stmt = None
+
+# Hot credentials, kept in front of the database; handlers call get_creds from worker threads
+_creds_cache: "TTLCache[str, Credentials]" = TTLCache(maxsize=CREDS_CACHE_SIZE, ttl=CREDS_CACHE_TTL_SECONDS)
+_creds_cache_lock = threading.Lock()
+
+# Other workers are told to drop a user's cached credentials when they change or are deleted
+CREDS_INVALIDATION_CHANNEL = "creds:invalidate"
+_worker_id = uuid.uuid4().hex
+_redis = None
+_invalidation_thread = None
+
+def _on_creds_invalidated(message):
+    """Evicts a user whose credentials another worker saved or deleted."""
+    sender, _, user_id = message['data'].partition(':')
+    if sender != _worker_id:
+        with _creds_cache_lock:
+            _creds_cache.pop(user_id, None)
+
+def _invalidate_creds(user_id: str):
+    """Evicts a user locally and tells every other worker to do the same."""
+    with _creds_cache_lock:
+        _creds_cache.pop(user_id, None)
+    if _redis is not None:
+        try:
+            _redis.publish(CREDS_INVALIDATION_CHANNEL, f"{_worker_id}:{user_id}")
+        except Exception as e:
+            logger.error(f"Failed to publish credentials invalidation for user {user_id}: {e}")
+
+def close_creds_invalidation():
+    """Stops listening for invalidations and closes the Redis connection, if any."""
+    global _redis, _invalidation_thread
+    if _invalidation_thread is not None:
+        _invalidation_thread.stop()
+        _invalidation_thread = None
+    if _redis is not None:
+        _redis.close()
+        _redis = None
+
+if REDIS_URL:
+    # Only needed when Redis is configured
+    import redis
+    
+    try:
+        _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+        pubsub = _redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{CREDS_INVALIDATION_CHANNEL: _on_creds_invalidated})
+        _invalidation_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        logger.info("Listening for credentials invalidations in Redis.")
+    except redis.RedisError as e:
+        logger.error(f"Failed to subscribe to credentials invalidations: {e}")
+        _redis = None
+
+def _migrate_token_column():
+    """Converts a legacy TEXT token_data column to BYTEA, keeping the stored JSON as UTF-8 bytes."""
+    columns = {column['name']: column['type'] for column in inspect(engine).get_columns('user_tokens')}
+    if isinstance(columns.get('token_data'), Text):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE user_tokens ALTER COLUMN token_data TYPE BYTEA "
+                "USING convert_to(token_data, 'UTF8')"
+            ))
+        logger.info("Migrated user_tokens.token_data from TEXT to BYTEA.")
 
 if DATABASE_URL:
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    # SQLAlchemy only accepts the postgresql:// scheme
+    db_url = DATABASE_URL.replace("postgres://", "postgresql://", 1) if DATABASE_URL.startswith("postgres://") else DATABASE_URL
     
     try:
-        engine = create_engine(DATABASE_URL)
+        engine = create_engine(db_url)
         metadata = MetaData()
         user_tokens = Table('user_tokens', metadata,
             Column('user_id', String, primary_key=True),
-            Column('token_data', Text, nullable=False)
+            Column('token_data', LargeBinary, nullable=False)
+        )
+        semantic_cache = Table('semantic_cache', metadata,
+            Column('cache_key', String, primary_key=True),
+            Column('entry', LargeBinary, nullable=False),
+            Column('expires_at', Float, nullable=False, index=True)
         )
         metadata.create_all(engine)
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        _migrate_token_column()
+        
+        # Built once so SQLAlchemy's compiled cache serves every query after the first
+        upsert_token_stmt = pg_insert(user_tokens).values(
+            user_id=bindparam('user_id'), token_data=bindparam('token_data')
+        )
+        upsert_token_stmt = upsert_token_stmt.on_conflict_do_update(
+            index_elements=[user_tokens.c.user_id],
+            set_={'token_data': upsert_token_stmt.excluded.token_data}
+        )
+        select_token_stmt = select(user_tokens.c.token_data).where(user_tokens.c.user_id == bindparam('user_id'))
+        delete_token_stmt = user_tokens.delete().where(user_tokens.c.user_id == bindparam('user_id'))
+        
+        upsert_cache_stmt = pg_insert(semantic_cache).values(
+            cache_key=bindparam('cache_key'), entry=bindparam('entry'), expires_at=bindparam('expires_at')
+        )
+        upsert_cache_stmt = upsert_cache_stmt.on_conflict_do_update(
+            index_elements=[semantic_cache.c.cache_key],
+            set_={'entry': upsert_cache_stmt.excluded.entry, 'expires_at': upsert_cache_stmt.excluded.expires_at}
+        )
+        select_cache_stmt = (
+            select(semantic_cache.c.entry)
+            .where(semantic_cache.c.expires_at > bindparam('now'))
+            .order_by(semantic_cache.c.expires_at)
+        )
+        purge_cache_stmt = semantic_cache.delete().where(semantic_cache.c.expires_at <= bindparam('now'))
         logger.info("Database connection established and table checked.")
     except Exception as e:
         logger.error(f"Failed to connect to database or setup table: {e}")
@@ -32,70 +136,104 @@ if DATABASE_URL:
 
 def save_creds(user_id: str, creds: Credentials):
     """Saves or updates a user's credentials in the database."""
-    if not SessionLocal:
+    if not engine:
         logger.error("Database not configured. Cannot save credentials.")
         return
     
-    session = SessionLocal()
     try:
-        token_json = json.dumps({
+        token_blob = ormsgpack.packb({
             'token': creds.token,
             'refresh_token': creds.refresh_token,
             'token_uri': creds.token_uri,
             'client_id': creds.client_id,
             'client_secret': creds.client_secret,
-            'scopes': creds.scopes
+            'scopes': creds.scopes,
+            # Without the expiry, restored credentials always look valid and are never refreshed
+            'expiry': creds.expiry.isoformat() if creds.expiry else None
         })
         
-        existing = session.query(user_tokens).filter_by(user_id=str(user_id)).first()
-        if existing:
-            session.query(user_tokens).filter_by(user_id=str(user_id)).update({"token_data": token_json})
-        else:
-            new_token = user_tokens.insert().values(user_id=str(user_id), token_data=token_json)
-            session.execute(new_token)
-            
-        session.commit()
+        # Single INSERT ... ON CONFLICT DO UPDATE round-trip; begin() commits or rolls back
+        with engine.begin() as conn:
+            conn.execute(upsert_token_stmt, {'user_id': str(user_id), 'token_data': token_blob})
+        _invalidate_creds(str(user_id))
+        with _creds_cache_lock:
+            _creds_cache[str(user_id)] = creds
         logger.info(f"Credentials saved for user {user_id}")
     except SQLAlchemyError as e:
         logger.error(f"Database error while saving credentials for user {user_id}: {e}")
-        session.rollback()
-    finally:
-        session.close()
+
+def _creds_from_blob(token_info: dict) -> Credentials:
+    """Rebuilds credentials from a stored token, restoring the naive UTC expiry google-auth expects."""
+    if token_info.get('expiry'):
+        token_info['expiry'] = datetime.fromisoformat(token_info['expiry'])
+    return Credentials(**token_info)
 
 def get_creds(user_id: str) -> Credentials | None:
     """Retrieves a user's credentials object from the database."""
-    if not SessionLocal:
+    if not engine:
         logger.error("Database not configured. Cannot get credentials.")
         return None
+    
+    with _creds_cache_lock:
+        creds = _creds_cache.get(str(user_id))
+    if creds:
+        return creds
         
-    session = SessionLocal()
     try:
-        result = session.query(user_tokens).filter_by(user_id=str(user_id)).first()
-        if result and result.token_data:
-            token_data = json.loads(result.token_data)
-            creds = Credentials(**token_data)
+        with engine.connect() as conn:
+            token_data = conn.execute(select_token_stmt, {'user_id': str(user_id)}).scalar()
+        if token_data:
+            token_blob = bytes(token_data)
+            # Rows written before the msgpack switch still hold a JSON object
+            if token_blob.startswith(b'{'):
+                creds = Credentials(**orjson.loads(token_blob))
+                save_creds(user_id, creds)
+            else:
+                creds = _creds_from_blob(ormsgpack.unpackb(token_blob))
+                with _creds_cache_lock:
+                    _creds_cache[str(user_id)] = creds
             logger.info(f"Credentials retrieved for user {user_id}")
             return creds
         return None
-    except (SQLAlchemyError, json.JSONDecodeError) as e:
-        logger.error(f"Database or JSON error while getting credentials for user {user_id}: {e}")
+    except (SQLAlchemyError, orjson.JSONDecodeError, ormsgpack.MsgpackDecodeError) as e:
+        logger.error(f"Database or decoding error while getting credentials for user {user_id}: {e}")
         return None
-    finally:
-        session.close()
 
 def delete_token(user_id: str):
     """Deletes a user's token from the database."""
-    if not SessionLocal:
+    if not engine:
         logger.error("Database not configured. Cannot delete token.")
         return
 
-    session = SessionLocal()
     try:
-        session.query(user_tokens).filter_by(user_id=str(user_id)).delete()
-        session.commit()
+        with engine.begin() as conn:
+            conn.execute(delete_token_stmt, {'user_id': str(user_id)})
+        _invalidate_creds(str(user_id))
         logger.info(f"Token deleted for user {user_id}")
     except SQLAlchemyError as e:
         logger.error(f"Database error while deleting token for user {user_id}: {e}")
-        session.rollback()
-    finally:
-        session.close()
\ No newline at end of file
+
+def save_cache_entry(cache_key: str, entry: bytes, expires_at: float):
+    """Saves or updates a packed semantic cache entry."""
+    if not engine:
+        return
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(upsert_cache_stmt, {'cache_key': cache_key, 'entry': entry, 'expires_at': expires_at})
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while saving semantic cache entry: {e}")
+
+def load_cache_entries() -> List[bytes]:
+    """Purges expired semantic cache entries and returns the rest, oldest first."""
+    if not engine:
+        return []
+
+    try:
+        now = time.time()
+        with engine.begin() as conn:
+            conn.execute(purge_cache_stmt, {'now': now})
+            return [bytes(entry) for entry in conn.execute(select_cache_stmt, {'now': now}).scalars()]
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while loading semantic cache entries: {e}")
+        return []
@@ -0,0 +1,14 @@
+import httpx
+
+# One pooled HTTP/2 client shared by the Mistral engine and the Calendar calls. Keeping the
+# TLS connections alive removes the handshake from every request, and concurrent handler
+# requests to the same host are multiplexed over one connection.
+HTTP_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=32)
+)
+
+async def close_http_client() -> None:
+    """Closes the shared HTTP client; call once on shutdown."""
+    await HTTP_CLIENT.aclose()
@@ -1,36 +1,201 @@
-import json
+import re
+import mmap
 import base64
+import hashlib
+import asyncio
 import logging
 import datetime
-from typing import Dict, Any, Optional, Union, Tuple
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Union, Tuple
 
+import orjson
 from mistralai import Mistral 
 from PIL import Image
 import io
 
-from config import MISTRAL_API_KEY, MISTRAL_MODEL
+from config import MISTRAL_API_KEY, MISTRAL_MODEL, MISTRAL_EMBED_MODEL, MISTRAL_BATCH_SIZE
+from src.batching import MessageBatcher
+from src.http_client import HTTP_CLIENT
 from src.prompts import (
-    INTENT_DETECTION_PROMPT, 
-    EVENT_EXTRACTION_PROMPT, 
     IMAGE_EXTRACTION_PROMPT,
-    BOT_RESPONSE_PROMPT
+    build_intent_prompt,
+    build_event_extraction_prompt,
+    build_intent_and_event_prompt,
+    build_batch_intent_and_event_prompt,
+    build_bot_response_prompt
 )
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Longest side, in pixels, of images sent to the vision model
+MAX_IMAGE_DIMENSION = 1024
+IMAGE_JPEG_QUALITY = 85
+# blake2b digest of an original image -> base64 of its downscaled JPEG, LRU ordered.
+# A retried or re-sent image skips the decode, resize, re-encode and base64 steps.
+PREPARED_IMAGE_CACHE_SIZE = 32
+_prepared_images: "OrderedDict[bytes, str]" = OrderedDict()
+
+def image_digest(image_data: Union[bytes, mmap.mmap]) -> bytes:
+    """Identifies an image by content; computed once per request and shared by the image caches."""
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+# A fenced ```json block, or else the outermost bare JSON object in the response
+_JSON_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```|(\{.*\})', re.DOTALL)
+
+def _json_payload_start(text: str) -> Optional[int]:
+    """
+    Locates the opening brace of a reply that begins with a JSON object.
+    
+    Args:
+        text: Reply text received so far
+        
+    Returns:
+        Optional[int]: Index of the brace, -1 if the reply starts with anything other than
+            a JSON object (optionally inside a ``` fence), or None if it is too early to tell
+    """
+    stripped = text.lstrip()
+    offset = len(text) - len(stripped)
+    if not stripped:
+        return None
+    if stripped[0] == '{':
+        return offset
+    if stripped[0] != '`':
+        return -1
+    if '\n' not in stripped:
+        return None if len(stripped) < 3 or stripped.startswith('```') else -1
+    if not stripped.startswith('```'):
+        return -1
+    fence_end = stripped.index('\n') + 1
+    body = stripped[fence_end:].lstrip()
+    if not body:
+        return None
+    return len(text) - len(body) if body[0] == '{' else -1
+
+# Messages that are only a greeting or a request for help are classified locally.
+# Both patterns must match the whole message, so "hi, add a meeting tomorrow" still goes to Mistral.
+_GREET_RE = re.compile(
+    r'^\s*(hi|hello|hey|hola|buenos d[ií]as|buenas( tardes| noches)?|good (morning|afternoon|evening))'
+    r'( there)?[\s!.,]*((how are you|how\'s it going|¿?c[oó]mo est[aá]s)( today)?[\s!.?]*)?$',
+    re.IGNORECASE
+)
+_HELP_RE = re.compile(
+    r'^\s*/?(help|ayuda|what can you do|how does this work)[\s!.?]*$',
+    re.IGNORECASE
+)
+
+# Mistral rides on the process-wide pooled HTTP/2 client
+_MISTRAL_CLIENT = Mistral(api_key=MISTRAL_API_KEY, async_client=HTTP_CLIENT)
+
 class MistralEngine:
-    def __init__(self):
-        """Initializes the processing engine with Mistral AI."""
-        self.client = Mistral(api_key=MISTRAL_API_KEY)
+    def __init__(self, batch_window_ms: int = 0):
+        """
+        Initializes the processing engine with Mistral AI.
+        
+        Args:
+            batch_window_ms: When positive, text messages arriving within this window
+                are analyzed together in a single Mistral call
+        """
+        self.client = _MISTRAL_CLIENT
         self.model = MISTRAL_MODEL
+        self.batcher = None
+        if batch_window_ms > 0:
+            self.batcher = MessageBatcher(self.process_messages, max_batch=MISTRAL_BATCH_SIZE,
+                                          window_ms=batch_window_ms)
     
-    def _call_mistral(self, prompt: str) -> str:
+    @staticmethod
+    def _fast_intent(message: str) -> Optional[Dict[str, Any]]:
+        """
+        Classifies obvious greetings and help requests without calling Mistral.
+        
+        Args:
+            message: User message
+            
+        Returns:
+            Dict: Intent information, or None if the message needs the model
+        """
+        if _GREET_RE.match(message):
+            return {'intent': 'greet', 'confidence': 1.0, 'explanation': 'Matched greeting pattern'}
+        if _HELP_RE.match(message):
+            return {'intent': 'help', 'confidence': 1.0, 'explanation': 'Matched help pattern'}
+        return None
+    
+    async def _stream_completion(self, messages: list, stop_at_json: bool = False) -> str:
+        """
+        Streams a chat completion from Mistral and collects the generated text.
+        
+        Args:
+            messages: Chat messages to send to Mistral
+            stop_at_json: Stop reading as soon as a reply that opens with a JSON object has
+                received all of it
+            
+        Returns:
+            str: The full response text, or the text up to the end of a leading JSON object
+        """
+        stream = await self.client.chat.stream_async(
+            model=self.model,
+            messages=messages,
+        )
+        text = ""
+        start = None
+        pos = 0
+        depth = 0
+        in_string = False
+        escaped = False
+        async with stream as events:
+            async for event in events:
+                if not event.data.choices:
+                    continue
+                content = event.data.choices[0].delta.content
+                if not isinstance(content, str):
+                    continue
+                text += content
+                if not stop_at_json:
+                    continue
+                if start is None:
+                    # Only a reply that opens with the JSON object can be cut short
+                    start = _json_payload_start(text)
+                    if start is None:
+                        continue
+                    if start < 0:
+                        stop_at_json = False
+                        continue
+                    pos = start
+                # Track brace depth outside JSON strings so the stream can be closed
+                # as soon as the object is complete, skipping any trailing prose
+                while pos < len(text):
+                    char = text[pos]
+                    pos += 1
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == '\\':
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"':
+                        in_string = True
+                    elif char == '{':
+                        depth += 1
+                    elif char == '}':
+                        depth -= 1
+                        if not depth:
+                            try:
+                                orjson.loads(text[start:pos])
+                                return text[:pos]
+                            except orjson.JSONDecodeError:
+                                # Not valid JSON after all; read the rest and let the parser decide
+                                stop_at_json = False
+                                break
+        return text
+    
+    async def _call_mistral(self, prompt: str, stop_at_json: bool = False) -> str:
         """
         Makes a call to the Mistral API.
         
         Args:
             prompt: The prompt to send to Mistral
+            stop_at_json: Whether the reply is a JSON object the stream can stop after
             
         Returns:
             str: The response from Mistral
@@ -38,29 +203,106 @@ class MistralEngine:
         try:
             # Formato actualizado para mensajes
             messages = [{"role": "user", "content": prompt}]
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages,
-            )
-            return response.choices[0].message.content
+            return await self._stream_completion(messages, stop_at_json)
         except Exception as e:
             logger.error(f"Error calling Mistral: {str(e)}")
             return ""
         
-    def _call_mistral_with_image(self, prompt: str, image_data: bytes) -> str:
+    async def warmup(self) -> None:
+        """Opens the pooled connection to Mistral ahead of the first message with a free models listing."""
+        try:
+            await self.client.models.list_async()
+        except Exception as e:
+            logger.warning(f"Mistral warmup failed: {str(e)}")
+    
+    async def close(self) -> None:
+        """Finishes any queued or in-flight message batches before shutdown."""
+        if self.batcher:
+            await self.batcher.close()
+    
+    async def embed(self, text: str) -> List[float]:
+        """
+        Computes the Mistral embedding of a text.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            List[float]: The embedding vector
+        """
+        response = await self.client.embeddings.create_async(
+            model=MISTRAL_EMBED_MODEL,
+            inputs=[text],
+        )
+        return response.data[0].embedding
+    
+    def _prepare_image(self, image_data: Union[bytes, mmap.mmap]) -> bytes:
+        """
+        Downscales an image and re-encodes it as JPEG to shrink the upload and the vision tokens billed.
+        
+        Args:
+            image_data: Binary data of the image, or a read-only mmap of the image file
+            
+        Returns:
+            bytes: JPEG data, or the original bytes if the image could not be decoded
+        """
+        try:
+            # An mmap is already a seekable file object; decoding from it skips copying the file
+            source = image_data if isinstance(image_data, mmap.mmap) else io.BytesIO(image_data)
+            with Image.open(source) as img:
+                # For JPEGs, let the decoder skip straight to a nearby scale instead of decoding full size
+                img.draft("RGB", (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+                img = img.convert("RGB")
+                img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+                buffer = io.BytesIO()
+                img.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+                return buffer.getvalue()
+        except Exception as e:
+            logger.warning(f"Could not resize image, sending original: {str(e)}")
+            return image_data
+    
+    def _prepare_and_encode(self, image_data: Union[bytes, mmap.mmap]) -> str:
+        """Downscales an image and returns its base64 encoding (the alphabet is pure ASCII)."""
+        return base64.b64encode(self._prepare_image(image_data)).decode('ascii')
+    
+    async def _encode_image(self, image_data: Union[bytes, mmap.mmap], digest: Optional[bytes] = None) -> str:
+        """
+        Returns the base64 payload for an image, reusing it if the same image was prepared recently.
+        
+        Args:
+            image_data: Binary data of the image
+            digest: image_digest() of the image, if the caller already computed it
+            
+        Returns:
+            str: Base64 of the downscaled JPEG
+        """
+        digest = digest or image_digest(image_data)
+        cached = _prepared_images.get(digest)
+        if cached:
+            _prepared_images.move_to_end(digest)
+            return cached
+        
+        # Pillow decoding and resizing is CPU-bound, so keep it off the event loop
+        encoded = await asyncio.to_thread(self._prepare_and_encode, image_data)
+        _prepared_images[digest] = encoded
+        if len(_prepared_images) > PREPARED_IMAGE_CACHE_SIZE:
+            _prepared_images.popitem(last=False)
+        return encoded
+    
+    async def _call_mistral_with_image(self, prompt: str, image_data: bytes, digest: Optional[bytes] = None) -> str:
         """
         Makes a call to the Mistral API with an image.
         
         Args:
             prompt: The prompt to send to Mistral
             image_data: Binary data of the image
+            digest: image_digest() of the image, if already computed
             
         Returns:
             str: The response from Mistral
         """
         try:
-            # Convert image to base64
-            base64_image = base64.b64encode(image_data).decode('utf-8')
+            base64_image = await self._encode_image(image_data, digest)
             
             # Create the message structure according to Mistral's documentation
             messages = [
@@ -80,12 +322,7 @@ class MistralEngine:
             ]
             
             # Call the API with the formatted message
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages
-            )
-            
-            return response.choices[0].message.content
+            return await self._stream_completion(messages, stop_at_json=True)
         except Exception as e:
             logger.error(f"Error calling Mistral with image: {str(e)}")
             return ""
@@ -101,28 +338,27 @@ class MistralEngine:
             Dict: Parsed JSON content or empty dictionary if there's an error
         """
         try:
-            # Try to find JSON in the response
-            json_str = ""
-            if '```json' in response:
-                json_str = response.split('```json')[1].split('```')[0].strip()
-            elif '```' in response:
-                json_str = response.split('```')[1].split('```')[0].strip()
-            else:
-                # Look for JSON patterns
-                start_idx = response.find('{')
-                end_idx = response.rfind('}')
-                if start_idx != -1 and end_idx != -1:
-                    json_str = response[start_idx:end_idx+1]
+            # Bare JSON replies (the common case) go straight to orjson, skipping the regex
+            stripped = response.strip()
+            if stripped.startswith('{'):
+                try:
+                    return orjson.loads(stripped)
+                except orjson.JSONDecodeError:
+                    pass
+            
+            # Find the JSON in the response with a single regex pass
+            match = _JSON_RE.search(response)
+            if not match:
+                return {}
+            json_str = match.group(1) or match.group(2)
             
             # Parse JSON
-            if json_str:
-                return json.loads(json_str)
-            return {}
+            return orjson.loads(json_str)
         except Exception as e:
             logger.error(f"Error parsing JSON response: {str(e)}")
             return {}
     
-    def detect_intent(self, message: str) -> Dict[str, Any]:
+    async def detect_intent(self, message: str) -> Dict[str, Any]:
         """
         Detects the user's intent from a message.
         
@@ -132,8 +368,8 @@ class MistralEngine:
         Returns:
             Dict: Information about the detected intent
         """
-        prompt = INTENT_DETECTION_PROMPT.format(user_message=message)
-        response = self._call_mistral(prompt)
+        prompt = build_intent_prompt(user_message=message)
+        response = await self._call_mistral(prompt, stop_at_json=True)
         intent_data = self._parse_json_response(response)
         
         # Set default values if information is missing
@@ -146,7 +382,7 @@ class MistralEngine:
         
         return intent_data
     
-    def extract_event_info(self, message: str) -> Dict[str, Any]:
+    async def extract_event_info(self, message: str) -> Dict[str, Any]:
         """
         Extracts event information from a message.
         
@@ -157,12 +393,12 @@ class MistralEngine:
             Dict: Extracted event information
         """
         current_dt = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        prompt = EVENT_EXTRACTION_PROMPT.format(
+        prompt = build_event_extraction_prompt(
             user_message=message,
             current_datetime=current_dt
         )
         
-        response = self._call_mistral(prompt)
+        response = await self._call_mistral(prompt, stop_at_json=True)
         event_data = self._parse_json_response(response)
         
         # Ensure all fields are present
@@ -176,18 +412,104 @@ class MistralEngine:
         
         return event_data
     
-    def extract_from_image(self, image_data: bytes) -> Dict[str, Any]:
+    async def detect_intent_and_extract(self, message: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Detects the user's intent and extracts event information with a single Mistral call.
+        
+        Args:
+            message: User message
+            
+        Returns:
+            Tuple: (intent information, extracted event information)
+        """
+        current_dt = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        prompt = build_intent_and_event_prompt(
+            user_message=message,
+            current_datetime=current_dt
+        )
+        
+        response = await self._call_mistral(prompt, stop_at_json=True)
+        return self._split_intent_and_event(self._parse_json_response(response))
+    
+    def _split_intent_and_event(self, intent_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Splits a combined intent/event result into intent and event dictionaries.
+        
+        Args:
+            intent_data: Parsed result with the intent fields and a nested "event"
+            
+        Returns:
+            Tuple: (intent information, extracted event information)
+        """
+        # Set default values if information is missing
+        if not intent_data or 'intent' not in intent_data:
+            intent_data = {
+                'intent': 'other',
+                'confidence': 0.0,
+                'explanation': 'Could not detect intent'
+            }
+        
+        event_data = intent_data.pop('event', None)
+        if intent_data.get('intent') != 'add_event':
+            return intent_data, {}
+        
+        if not isinstance(event_data, dict):
+            event_data = {}
+        
+        # Check and complete missing fields
+        for field in ['summary', 'location', 'description', 'start_time', 'end_time', 'confidence']:
+            if field not in event_data:
+                event_data[field] = None
+        
+        return intent_data, event_data
+    
+    async def process_messages(self, messages: List[str]) -> List[Tuple[Dict, Dict, Dict]]:
+        """
+        Processes several text messages with a single Mistral call.
+        
+        Args:
+            messages: User messages
+            
+        Returns:
+            List: One (intent, extracted information, result) tuple per message, in order
+        """
+        if len(messages) == 1:
+            intent_data, extracted_info = await self.detect_intent_and_extract(messages[0])
+            return [(intent_data, extracted_info, {})]
+        
+        current_dt = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        prompt = build_batch_intent_and_event_prompt(
+            user_messages=orjson.dumps(messages).decode(),
+            current_datetime=current_dt
+        )
+        
+        response = await self._call_mistral(prompt, stop_at_json=True)
+        results = self._parse_json_response(response).get('results')
+        
+        if not isinstance(results, list) or len(results) != len(messages):
+            logger.warning("Batched response did not match the batch, processing messages one by one")
+            pairs = await asyncio.gather(*(self.detect_intent_and_extract(m) for m in messages))
+            return [(intent_data, extracted_info, {}) for intent_data, extracted_info in pairs]
+        
+        processed = []
+        for result in results:
+            intent_data, extracted_info = self._split_intent_and_event(result if isinstance(result, dict) else {})
+            processed.append((intent_data, extracted_info, {}))
+        return processed
+    
+    async def extract_from_image(self, image_data: bytes, digest: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Extracts event information from an image.
         
         Args:
             image_data: Binary data of the image
+            digest: image_digest() of the image, if already computed
             
         Returns:
             Dict: Extracted event information
         """
         prompt = IMAGE_EXTRACTION_PROMPT
-        response = self._call_mistral_with_image(prompt, image_data)
+        response = await self._call_mistral_with_image(prompt, image_data, digest)
         event_data = self._parse_json_response(response)
         
         # Ensure all fields are present
@@ -202,7 +524,7 @@ class MistralEngine:
         
         return event_data
     
-    def generate_response(self, intent: str, extracted_info: Dict, action_result: Dict) -> str:
+    async def generate_response(self, intent: str, extracted_info: Dict, action_result: Dict) -> str:
         """
         Generates a response for the user.
         
@@ -214,13 +536,13 @@ class MistralEngine:
         Returns:
             str: Generated response
         """
-        prompt = BOT_RESPONSE_PROMPT.format(
+        prompt = build_bot_response_prompt(
             intent=intent,
-            extracted_info=json.dumps(extracted_info, ensure_ascii=False),
-            action_result=json.dumps(action_result, ensure_ascii=False)
+            extracted_info=orjson.dumps(extracted_info).decode(),
+            action_result=orjson.dumps(action_result).decode()
         )
         
-        response = self._call_mistral(prompt)
+        response = await self._call_mistral(prompt)
         
         # Remove possible code markers
         if '```' in response:
@@ -228,42 +550,58 @@ class MistralEngine:
         
         return response
     
-    def process_message(self, message: Union[str, bytes], is_image: bool = False) -> Tuple[Dict, Dict, Dict]:
+    async def _process_image(self, image_data: Union[bytes, mmap.mmap],
+                             digest: Optional[bytes] = None) -> Tuple[Dict, Dict, Dict]:
+        """
+        Extracts an event from an image and derives the intent from the extraction confidence.
+        
+        Args:
+            image_data: Binary data of the image
+            digest: image_digest() of the image, if already computed
+            
+        Returns:
+            Tuple: (intent, extracted information, result)
+        """
+        extracted_info = await self.extract_from_image(image_data, digest)
+        
+        # Determine intent based on extraction confidence
+        confidence = extracted_info.get('confidence', 0)
+        # Ensure confidence is a number, not None
+        if confidence is None:
+            confidence = 0
+        intent_data = {
+            'intent': 'add_event' if confidence >= 0.5 else 'other',
+            'confidence': confidence,
+            'explanation': 'Information extracted from image'
+        }
+        
+        return intent_data, extracted_info, {}
+    
+    async def process_message(self, message: Union[str, bytes], is_image: bool = False,
+                              user_id: Optional[str] = None) -> Tuple[Dict, Dict, Dict]:
         """
         Processes a user message, detects intent and extracts information.
         
         Args:
             message: User message (text or image data)
             is_image: True if the message is an image
+            user_id: Sender of the message; text is only batched with the same sender's messages
             
         Returns:
             Tuple: (intent, extracted information, result)
         """
         # If it's an image, extract information directly
         if is_image:
-            extracted_info = self.extract_from_image(message)
-            
-            # Determine intent based on extraction confidence
-            confidence = extracted_info.get('confidence', 0)
-            # Ensure confidence is a number, not None
-            if confidence is None:
-                confidence = 0
-            intent_data = {
-                'intent': 'add_event' if confidence >= 0.5 else 'other',
-                'confidence': confidence,
-                'explanation': 'Information extracted from image'
-            }
-            
-            return intent_data, extracted_info, {}
+            return await self._process_image(message)
         
-        # If it's text, process normally
+        # If it's text, detect the intent and extract the event in one round-trip, shared
+        # with any other messages from the same user that arrive within the batch window
         message_text = message if isinstance(message, str) else message.decode('utf-8')
-        intent_data = self.detect_intent(message_text)
-        
-        # If the intent is to add an event, extract information
-        if intent_data.get('intent') == 'add_event':
-            extracted_info = self.extract_event_info(message_text)
-        else:
-            extracted_info = {}
+        intent_data = self._fast_intent(message_text)
+        if intent_data:
+            return intent_data, {}, {}
+        if self.batcher:
+            return await self.batcher.submit(message_text, key=user_id)
+        intent_data, extracted_info = await self.detect_intent_and_extract(message_text)
         
         return intent_data, extracted_info, {}
\ No newline at end of file
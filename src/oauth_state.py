@@ -0,0 +1,80 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from config import REDIS_URL, OAUTH_STATE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# How often abandoned in-memory states are swept
+PRUNE_INTERVAL_SECONDS = 60
+
+class OAuthStateStore:
+    """
+    Maps pending OAuth `state` values to the Telegram user that started the flow.
+    
+    With REDIS_URL set, states live in Redis with a TTL, so any worker can finish a flow
+    another one started. Otherwise they are kept in this process's memory and swept
+    periodically once prune() is running.
+    """
+    
+    def __init__(self, redis_url: Optional[str] = REDIS_URL, ttl_seconds: int = OAUTH_STATE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._redis = None
+        # state -> (user_id, monotonic time issued)
+        self._states: Dict[str, Tuple[str, float]] = {}
+        self._prune_task: Optional[asyncio.Task] = None
+        if redis_url:
+            # Only needed when Redis is configured
+            from redis import asyncio as aioredis
+            self._redis = aioredis.from_url(redis_url, decode_responses=True)
+            logger.info("Storing OAuth states in Redis.")
+    
+    @staticmethod
+    def _key(state: str) -> str:
+        return f"oauth:{state}"
+    
+    async def put(self, state: str, user_id: str) -> None:
+        """Remembers which user a freshly issued state belongs to."""
+        if self._redis:
+            await self._redis.set(self._key(state), user_id, ex=self.ttl_seconds)
+        else:
+            self._states[state] = (user_id, time.monotonic())
+    
+    async def pop(self, state: str) -> Optional[str]:
+        """Returns and forgets the user for a state, or None if it is unknown or expired."""
+        if self._redis:
+            # GETDEL makes each state single-use even with several workers racing on it
+            return await self._redis.getdel(self._key(state))
+        entry = self._states.pop(state, None)
+        if not entry or entry[1] < time.monotonic() - self.ttl_seconds:
+            return None
+        return entry[0]
+    
+    def _prune(self) -> None:
+        """Drops in-memory states older than the TTL."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [state for state, (_, issued) in self._states.items() if issued < cutoff]
+        for state in expired:
+            del self._states[state]
+        if expired:
+            logger.info(f"Pruned {len(expired)} abandoned OAuth states.")
+    
+    async def _prune_loop(self) -> None:
+        while True:
+            await asyncio.sleep(PRUNE_INTERVAL_SECONDS)
+            self._prune()
+    
+    def start_pruning(self) -> None:
+        """Starts sweeping abandoned in-memory states; Redis expires its keys on its own."""
+        if not self._redis and self._prune_task is None:
+            self._prune_task = asyncio.create_task(self._prune_loop())
+    
+    async def close(self) -> None:
+        """Stops the sweeper and closes the Redis connection pool, if any."""
+        if self._prune_task:
+            self._prune_task.cancel()
+            self._prune_task = None
+        if self._redis:
+            await self._redis.aclose()
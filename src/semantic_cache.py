@@ -0,0 +1,292 @@
+import re
+import time
+import asyncio
+import logging
+import datetime
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+import ormsgpack
+
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_SIZE
+from src import database
+from src.mistral_engine import MistralEngine, image_digest
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_DIGITS_RE = re.compile(r'\d+')
+# Intents whose results carry no extracted entities. A paraphrase that names another person,
+# day or place embeds almost identically, so add_event results are only served on exact matches
+SEMANTIC_HIT_INTENTS = frozenset({'greet', 'help', 'other'})
+
+def normalize_message(message: str) -> str:
+    """Lowercases a message and collapses whitespace so trivially different texts share a key."""
+    return " ".join(message.lower().split())
+
+class SemanticCache:
+    """
+    In-memory cache of (intent_data, extracted_info) results for text messages,
+    looked up by cosine similarity between message embeddings. Entries can be packed
+    for persistence and restored on startup.
+    """
+    
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # normalized message -> (embedding, intent_data, extracted_info, expires_at, day, digits)
+        self._entries: "OrderedDict[str, Tuple]" = OrderedDict()
+        self._keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+    
+    def _evict_expired(self):
+        """Drops entries past their TTL or created on another day."""
+        now = time.time()
+        today = datetime.date.today()
+        expired = [key for key, entry in self._entries.items() if entry[3] < now or entry[4] != today]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+    
+    def _index(self) -> Tuple[np.ndarray, List[str]]:
+        """Returns the embedding matrix and its row keys, rebuilding them after changes."""
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+        return self._matrix, self._keys
+    
+    def get(self, message: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Returns the cached result for this exact message (after normalization), if any.
+        Unlike lookup(), this needs no embedding, so a hit skips the embeddings call too.
+        
+        Args:
+            message: User message
+            
+        Returns:
+            Optional[Tuple]: (intent_data, extracted_info) copies, or None on a miss
+        """
+        key = normalize_message(message)
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        if entry[3] < time.time() or entry[4] != datetime.date.today():
+            del self._entries[key]
+            self._matrix = None
+            return None
+        
+        self._entries.move_to_end(key)
+        logger.info("Exact cache hit")
+        return dict(entry[1]), dict(entry[2])
+    
+    def lookup(self, message: str, embedding: List[float]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Finds a cached result for a message similar enough to the given one. Only results
+        without extracted entities are shared between paraphrases; see get() for the rest.
+        
+        Args:
+            message: User message
+            embedding: Embedding of the user message
+            
+        Returns:
+            Optional[Tuple]: (intent_data, extracted_info) copies, or None on a miss
+        """
+        self._evict_expired()
+        if not self._entries:
+            return None
+        
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query)
+        matrix, keys = self._index()
+        sims = matrix @ query
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        
+        key = keys[best]
+        entry = self._entries[key]
+        # Paraphrases may share a cached result, but not extracted events or different times and dates
+        if entry[1].get('intent') not in SEMANTIC_HIT_INTENTS or entry[5] != _DIGITS_RE.findall(message):
+            return None
+        
+        self._entries.move_to_end(key)
+        logger.info(f"Semantic cache hit (similarity {sims[best]:.3f})")
+        return dict(entry[1]), dict(entry[2])
+    
+    def store(self, message: str, embedding: List[float],
+              intent_data: Dict[str, Any], extracted_info: Dict[str, Any]) -> str:
+        """
+        Caches the result for a message, evicting the least recently used entry when full.
+        
+        Args:
+            message: User message
+            embedding: Embedding of the user message
+            intent_data: Detected intent
+            extracted_info: Extracted event information
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector)
+        
+        key = normalize_message(message)
+        self._entries[key] = (
+            vector,
+            dict(intent_data),
+            dict(extracted_info),
+            time.time() + self.ttl_seconds,
+            datetime.date.today(),
+            _DIGITS_RE.findall(message)
+        )
+        self._entries.move_to_end(key)
+        self._trim()
+        return key
+    
+    def _trim(self):
+        """Evicts least recently used entries beyond max_entries."""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+    
+    def pack(self, key: str) -> Tuple[bytes, float]:
+        """
+        Serializes a cached entry for persistence.
+        
+        Args:
+            key: Normalized message key returned by store()
+            
+        Returns:
+            Tuple: (msgpack blob, expiry timestamp)
+        """
+        vector, intent_data, extracted_info, expires_at, day, digits = self._entries[key]
+        blob = ormsgpack.packb([
+            key, vector.tobytes(), intent_data, extracted_info, expires_at, day.isoformat(), digits
+        ])
+        return blob, expires_at
+    
+    def restore(self, blobs: List[bytes]) -> int:
+        """
+        Loads packed entries, skipping any that expired or belong to another day.
+        
+        Args:
+            blobs: Entries produced by pack(), oldest first
+            
+        Returns:
+            int: Number of entries restored
+        """
+        now = time.time()
+        today = datetime.date.today()
+        restored = 0
+        for blob in blobs:
+            try:
+                key, vector, intent_data, extracted_info, expires_at, day, digits = ormsgpack.unpackb(blob)
+            except (ormsgpack.MsgpackDecodeError, ValueError) as e:
+                logger.warning(f"Skipping unreadable semantic cache entry: {str(e)}")
+                continue
+            day = datetime.date.fromisoformat(day)
+            if expires_at < now or day != today:
+                continue
+            self._entries[key] = (
+                np.frombuffer(vector, dtype=np.float32), intent_data, extracted_info, expires_at, day, digits
+            )
+            self._entries.move_to_end(key)
+            restored += 1
+        self._trim()
+        return restored
+
+class CachingMistralEngine(MistralEngine):
+    """
+    MistralEngine that answers repeated or paraphrased text messages from a SemanticCache.
+    When the database is configured, cached results are written through to it so they
+    survive restarts.
+    """
+    
+    def __init__(self, cache: Optional[SemanticCache] = None, batch_window_ms: int = 0):
+        super().__init__(batch_window_ms=batch_window_ms)
+        self.cache = cache or SemanticCache()
+        self._pending_writes = set()
+        # blake2b digest of the image -> (intent_data, extracted_info, expires_at), LRU ordered
+        self._image_results: "OrderedDict[bytes, Tuple]" = OrderedDict()
+    
+    def load_persisted_cache(self) -> int:
+        """Restores the unexpired entries saved by a previous run; blocking, call off the event loop."""
+        restored = self.cache.restore(database.load_cache_entries())
+        if restored:
+            logger.info(f"Restored {restored} semantic cache entries")
+        return restored
+    
+    def _persist(self, key: str):
+        """Writes a cache entry to the database in the background without delaying the reply."""
+        if not database.engine:
+            return
+        blob, expires_at = self.cache.pack(key)
+        task = asyncio.create_task(asyncio.to_thread(database.save_cache_entry, key, blob, expires_at))
+        # Keep a reference until done so the task isn't garbage collected mid-write
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+    
+    async def process_message(self, message: Union[str, bytes], is_image: bool = False,
+                              user_id: Optional[str] = None) -> Tuple[Dict, Dict, Dict]:
+        """
+        Processes a user message, serving text messages from the cache when possible.
+        
+        Args:
+            message: User message (text or image data)
+            is_image: True if the message is an image
+            user_id: Sender of the message, used to batch cache misses per user
+            
+        Returns:
+            Tuple: (intent, extracted information, result)
+        """
+        if is_image:
+            return await self._process_image(message)
+        
+        message_text = message if isinstance(message, str) else message.decode('utf-8')
+        # Greetings and help requests are classified locally, no embedding needed
+        if self._fast_intent(message_text):
+            return await super().process_message(message_text, user_id=user_id)
+        
+        cached = self.cache.get(message_text)
+        if cached:
+            intent_data, extracted_info = cached
+            return intent_data, extracted_info, {}
+        
+        try:
+            embedding = await self.embed(message_text)
+        except Exception as e:
+            logger.warning(f"Could not embed message, skipping semantic cache: {str(e)}")
+            return await super().process_message(message_text, user_id=user_id)
+        
+        cached = self.cache.lookup(message_text, embedding)
+        if cached:
+            intent_data, extracted_info = cached
+            return intent_data, extracted_info, {}
+        
+        intent_data, extracted_info, result = await super().process_message(message_text, user_id=user_id)
+        # Don't cache the fallback returned when Mistral failed or gave unparseable output
+        if intent_data.get('confidence'):
+            self._persist(self.cache.store(message_text, embedding, intent_data, extracted_info))
+        return intent_data, extracted_info, result
+    
+    async def _process_image(self, image_data: bytes, digest: Optional[bytes] = None) -> Tuple[Dict, Dict, Dict]:
+        """Serves byte-identical images (e.g. a forwarded flyer) from an exact-match cache."""
+        # Hashed once here; the engine reuses the digest for its prepared-image cache
+        digest = digest or image_digest(image_data)
+        entry = self._image_results.get(digest)
+        if entry and entry[2] >= time.time():
+            self._image_results.move_to_end(digest)
+            logger.info("Image cache hit")
+            return dict(entry[0]), dict(entry[1]), {}
+        
+        intent_data, extracted_info, result = await super()._process_image(image_data, digest)
+        if extracted_info.get('confidence'):
+            self._image_results[digest] = (
+                dict(intent_data), dict(extracted_info), time.time() + self.cache.ttl_seconds
+            )
+            self._image_results.move_to_end(digest)
+            while len(self._image_results) > self.cache.max_entries:
+                self._image_results.popitem(last=False)
+        return intent_data, extracted_info, result
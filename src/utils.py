@@ -1,7 +1,7 @@
-import os
 import base64
 import logging
 import json
+import functools
 from typing import Dict, Any, Optional, Union
 from datetime import datetime, timedelta
 import tempfile
@@ -10,6 +10,7 @@ import uuid
 # Configure logging
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=4096)
 def format_datetime_for_user(dt_str: str) -> str:
     """
     Formats an ISO datetime to present it to the user.
@@ -76,25 +77,6 @@ def create_temp_file(data: bytes, suffix: str = "") -> str:
         logger.error(f"Error creating temporary file: {str(e)}")
         return ""
 
-def safe_delete_file(file_path: str) -> bool:
-    """
-    Safely deletes a file.
-    
-    Args:
-        file_path: Path to the file to delete
-        
-    Returns:
-        bool: True if deleted successfully, False otherwise
-    """
-    try:
-        if os.path.exists(file_path):
-            os.unlink(file_path)
-            return True
-        return False
-    except Exception as e:
-        logger.error(f"Error deleting file: {str(e)}")
-        return False
-
 def format_event_for_display(event_data: Dict[str, Any]) -> str:
     """
     Formats event data to display to the user.
@@ -1,11 +1,11 @@
 import os
 import logging
-import tempfile
+import functools
 import secrets
 from typing import Dict, Any
 from urllib.parse import urljoin
 import asyncio
-import json
+import orjson
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -18,10 +18,24 @@ from telegram.ext import (
 from aiohttp import web
 from google_auth_oauthlib.flow import Flow
 
-from config import TELEGRAM_TOKEN, GOOGLE_CREDENTIALS_FILE, GOOGLE_SCOPES
+from config import (
+    TELEGRAM_TOKEN,
+    GOOGLE_CREDENTIALS_FILE,
+    GOOGLE_CREDENTIALS_JSON,
+    GOOGLE_SCOPES,
+    APP_URL,
+    PORT,
+    WEB_WORKERS,
+    WHISPER_MODEL_SIZE,
+    MISTRAL_BATCH_WINDOW_MS,
+    SEMANTIC_CACHE_ENABLED,
+)
 from src.mistral_engine import MistralEngine
+from src.semantic_cache import CachingMistralEngine
+from src.http_client import close_http_client
+from src.oauth_state import OAuthStateStore
 from src.audio_processor import AudioProcessor
-from src.calendar_events import create_event_with_creds
+from src.calendar_events import create_event_async
 from src import database
 
 # --- Basic Configuration ---
@@ -32,46 +46,79 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- App Initialization ---
-mistral_engine = MistralEngine()
+# Upper bound on updates handled concurrently; keeps bursts from spawning unbounded tasks
+CONCURRENT_UPDATES = 64
+# Text messages that repeat or paraphrase a recent one are answered without a completion call
+# Cache misses arriving close together share one batched Mistral call
+engine_class = CachingMistralEngine if SEMANTIC_CACHE_ENABLED else MistralEngine
+mistral_engine = engine_class(batch_window_ms=MISTRAL_BATCH_WINDOW_MS)
 audio_processor = AudioProcessor()
-audio_processor.load_model("tiny")
 
-# This dictionary will temporarily store the state for the OAuth flow
-# In a larger application, you might use a database or Redis for this
-oauth_states: Dict[str, str] = {}
+# Pending OAuth flows: in Redis when REDIS_URL is set, otherwise in memory
+oauth_states = OAuthStateStore()
+
+# --- Reply Texts ---
+# Built once at import; handlers only fill in the per-user parts
+START_TEXT_TEMPLATE = (
+    "Hello {name}! I'm your calendar assistant.\n\n"
+    "To get started, connect your Google Calendar using the /connect command.\n\n"
+    "Then, you can ask me things like 'Remind me about the meeting with John on Friday at 3 PM' "
+    "or send me an image of an event."
+)
+HELP_TEXT = (
+    "I can help you manage your calendar. Here's what you can do:\n\n"
+    "1. Connect your calendar with /connect.\n"
+    "2. Send me a text, audio, or image with event information.\n"
+    "3. Disconnect your calendar at any time with /disconnect.\n"
+    "4. Check the connection status with /status."
+)
+ALREADY_CONNECTED_TEXT = (
+    "Your Google Calendar is already connected. "
+    "If you want to use a different account, please /disconnect first."
+)
+CONNECT_TEXT = (
+    "To add events directly to your calendar, I need your permission. "
+    "Please click the button below to authorize access to your Google Calendar."
+)
+CONNECT_BUTTON_LABEL = "Connect to Google Calendar"
+VIEW_EVENT_BUTTON_LABEL = "View Event in Google Calendar"
+DISCONNECTED_TEXT = "Your calendar has been disconnected. I have deleted your credentials from my system."
+NOTHING_TO_DISCONNECT_TEXT = "You didn't have a calendar connected."
+STATUS_CONNECTED_TEXT = "✅ Your Google Calendar is connected."
+STATUS_DISCONNECTED_TEXT = "❌ Your Google Calendar is not connected. Use /connect to get started."
 
 # --- OAuth & Web Server Functions ---
 
 def get_redirect_uri() -> str:
     """Constructs the redirect URI from environment variables."""
-    app_url = os.environ.get('APP_URL')
-    if not app_url:
+    if not APP_URL:
         logger.warning("APP_URL environment variable not set. Using localhost.")
         return "http://localhost:8080/oauth2callback"
-    return urljoin(app_url, '/oauth2callback')
+    return urljoin(APP_URL, '/oauth2callback')
 
-def get_google_flow(redirect_uri: str) -> Flow:
+@functools.lru_cache(maxsize=1)
+def get_client_config() -> Dict[str, Any]:
     """
-    Creates a Google OAuth Flow object, loading credentials from an environment
+    Loads the OAuth client configuration once per process, from an environment
     variable in production or a local file in development.
     """
-    creds_json_str = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-    if creds_json_str:
+    if GOOGLE_CREDENTIALS_JSON:
         # Production: Load from environment variable
-        client_config = json.loads(creds_json_str)
-        return Flow.from_client_config(
-            client_config, scopes=GOOGLE_SCOPES, redirect_uri=redirect_uri
-        )
-    else:
-        # Development: Load from local file
-        if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
-            raise FileNotFoundError(
-                f"{GOOGLE_CREDENTIALS_FILE} not found. Please ensure it is in the root directory "
-                "or set GOOGLE_CREDENTIALS_JSON environment variable."
-            )
-        return Flow.from_client_secrets_file(
-            GOOGLE_CREDENTIALS_FILE, scopes=GOOGLE_SCOPES, redirect_uri=redirect_uri
+        return orjson.loads(GOOGLE_CREDENTIALS_JSON)
+    # Development: Load from local file
+    if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
+        raise FileNotFoundError(
+            f"{GOOGLE_CREDENTIALS_FILE} not found. Please ensure it is in the root directory "
+            "or set GOOGLE_CREDENTIALS_JSON environment variable."
         )
+    with open(GOOGLE_CREDENTIALS_FILE, 'rb') as f:
+        return orjson.loads(f.read())
+
+def get_google_flow(redirect_uri: str) -> Flow:
+    """Creates a Google OAuth Flow object from the cached client configuration."""
+    return Flow.from_client_config(
+        get_client_config(), scopes=GOOGLE_SCOPES, redirect_uri=redirect_uri
+    )
 
 async def oauth_callback(request: web.Request) -> web.Response:
     """
@@ -82,18 +129,18 @@ async def oauth_callback(request: web.Request) -> web.Response:
         params = request.query
         state = params.get('state')
         
-        if not state or state not in oauth_states:
+        user_id = await oauth_states.pop(state) if state else None
+        if not user_id:
             logger.warning("Received OAuth callback with invalid state.")
             return web.Response(text="Error: Invalid state parameter. Please try connecting again.", status=400)
-
-        user_id = oauth_states.pop(state)
         
         flow = get_google_flow(get_redirect_uri())
         
-        flow.fetch_token(authorization_response=str(request.url))
+        # The token exchange and the database write both block, so keep them off the event loop
+        await asyncio.to_thread(flow.fetch_token, authorization_response=str(request.url))
         creds = flow.credentials
         
-        database.save_creds(user_id, creds)
+        await asyncio.to_thread(database.save_creds, user_id, creds)
         
         logger.info(f"Successfully saved credentials for user {user_id}")
         
@@ -112,31 +159,22 @@ async def oauth_callback(request: web.Request) -> web.Response:
 
 # --- Telegram Command Handlers ---
 
+def link_keyboard(label: str, url: str) -> InlineKeyboardMarkup:
+    """Builds the single-button inline keyboard used to hand the user a link."""
+    return InlineKeyboardMarkup(((InlineKeyboardButton(label, url=url),),))
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_name = update.effective_user.first_name
-    await update.message.reply_text(
-        f"Hello {user_name}! I'm your calendar assistant.\n\n"
-        f"To get started, connect your Google Calendar using the /connect command.\n\n"
-        f"Then, you can ask me things like 'Remind me about the meeting with John on Friday at 3 PM' "
-        f"or send me an image of an event."
-    )
+    await update.message.reply_text(START_TEXT_TEMPLATE.format(name=update.effective_user.first_name))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
-        "I can help you manage your calendar. Here's what you can do:\n\n"
-        "1. Connect your calendar with /connect.\n"
-        "2. Send me a text, audio, or image with event information.\n"
-        "3. Disconnect your calendar at any time with /disconnect.\n"
-        "4. Check the connection status with /status."
-    )
+    await update.message.reply_text(HELP_TEXT)
 
 async def connect_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Starts the OAuth2 flow to connect a user's Google Calendar."""
     user_id = str(update.effective_user.id)
     
-    if database.get_creds(user_id):
-        await update.message.reply_text("Your Google Calendar is already connected. "
-                                      "If you want to use a different account, please /disconnect first.")
+    if await asyncio.to_thread(database.get_creds, user_id):
+        await update.message.reply_text(ALREADY_CONNECTED_TEXT)
         return
 
     flow = get_google_flow(get_redirect_uri())
@@ -145,36 +183,29 @@ async def connect_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     flow.prompt = 'consent'
     
     state = secrets.token_urlsafe(16)
-    oauth_states[state] = user_id
+    await oauth_states.put(state, user_id)
     
     authorization_url, _ = flow.authorization_url(state=state)
     
-    keyboard = [[InlineKeyboardButton("Connect to Google Calendar", url=authorization_url)]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        "To add events directly to your calendar, I need your permission. "
-        "Please click the button below to authorize access to your Google Calendar.",
-        reply_markup=reply_markup
-    )
+    await update.message.reply_text(CONNECT_TEXT, reply_markup=link_keyboard(CONNECT_BUTTON_LABEL, authorization_url))
 
 
 async def disconnect_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disconnects the user\'s Google Calendar."""
     user_id = str(update.effective_user.id)
-    if database.get_creds(user_id):
-        database.delete_token(user_id)
-        await update.message.reply_text("Your calendar has been disconnected. I have deleted your credentials from my system.")
+    if await asyncio.to_thread(database.get_creds, user_id):
+        await asyncio.to_thread(database.delete_token, user_id)
+        await update.message.reply_text(DISCONNECTED_TEXT)
     else:
-        await update.message.reply_text("You didn\'t have a calendar connected.")
+        await update.message.reply_text(NOTHING_TO_DISCONNECT_TEXT)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Checks if the user\'s calendar is connected."""
     user_id = str(update.effective_user.id)
-    if database.get_creds(user_id):
-        await update.message.reply_text("✅ Your Google Calendar is connected.")
+    if await asyncio.to_thread(database.get_creds, user_id):
+        await update.message.reply_text(STATUS_CONNECTED_TEXT)
     else:
-        await update.message.reply_text("❌ Your Google Calendar is not connected. Use /connect to get started.")
+        await update.message.reply_text(STATUS_DISCONNECTED_TEXT)
 
 # --- Core Processing Functions ---
 
@@ -182,104 +213,117 @@ async def process_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     message_text = update.message.text
     processing_message = await update.message.reply_text("Processing your message...")
     try:
-        intent_data, extracted_info, _ = mistral_engine.process_message(message_text)
-        
-        if intent_data.get('intent') == 'add_event':
-            await handle_add_event(update, context, extracted_info, processing_message)
-        else:
-            await update.message.reply_text("I'm not sure what you mean. Please try to be more specific.")
-            await processing_message.delete()
+        intent_data, extracted_info, _ = await mistral_engine.process_message(message_text, user_id=str(update.effective_user.id))
+        await dispatch_intent(update, context, intent_data, extracted_info, processing_message,
+                              "I'm not sure what you mean. Please try to be more specific.")
     except Exception as e:
         logger.error(f"Error processing text: {e}", exc_info=True)
-        await processing_message.delete()
-        await update.message.reply_text("Sorry, an error occurred while processing your message.")
+        await processing_message.edit_text("Sorry, an error occurred while processing your message.")
 
 async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     processing_message = await update.message.reply_text("Processing your audio...")
     try:
         audio_file = await context.bot.get_file(update.message.voice.file_id)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_file:
-            await audio_file.download_to_drive(temp_file.name)
-            transcription = audio_processor.transcribe_audio(temp_file.name)
-        os.unlink(temp_file.name)
+        # Decode straight from memory; the voice note never touches the disk
+        audio_data = await audio_file.download_as_bytearray()
+        transcription = await audio_processor.transcribe_audio_async(audio_data)
 
         if transcription:
             await update.message.reply_text(f'I heard: "{transcription}"')
-            intent_data, extracted_info, _ = mistral_engine.process_message(transcription)
-            if intent_data.get('intent') == 'add_event':
-                await handle_add_event(update, context, extracted_info, processing_message)
-            else:
-                await update.message.reply_text("I couldn't identify an event in your audio.")
-                await processing_message.delete()
+            intent_data, extracted_info, _ = await mistral_engine.process_message(transcription, user_id=str(update.effective_user.id))
+            await dispatch_intent(update, context, intent_data, extracted_info, processing_message,
+                                  "I couldn't identify an event in your audio.")
         else:
-            await update.message.reply_text("I couldn't transcribe your audio.")
-            await processing_message.delete()
+            await processing_message.edit_text("I couldn't transcribe your audio.")
     except Exception as e:
         logger.error(f"Error processing audio: {e}", exc_info=True)
-        await processing_message.delete()
-        await update.message.reply_text("Sorry, an error occurred while processing your audio.")
+        await processing_message.edit_text("Sorry, an error occurred while processing your audio.")
 
 async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     processing_message = await update.message.reply_text("Processing your image...")
     try:
         photo = update.message.photo[-1]
         photo_file = await context.bot.get_file(photo.file_id)
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            await photo_file.download_to_drive(temp_file.name)
-            with open(temp_file.name, 'rb') as f:
-                image_data = f.read()
-        os.unlink(temp_file.name)
-
-        intent_data, extracted_info, _ = mistral_engine.process_message(image_data, is_image=True)
-        if intent_data.get('intent') == 'add_event':
-            await handle_add_event(update, context, extracted_info, processing_message)
-        else:
-            await update.message.reply_text("I couldn't detect an event in the image.")
-            await processing_message.delete()
+        # The one copy of the photo: BytesIO shares an immutable bytes buffer instead of copying
+        # it, so PIL decodes from this same memory, and only the small re-encoded JPEG is base64'd
+        image_data = bytes(await photo_file.download_as_bytearray())
+
+        intent_data, extracted_info, _ = await mistral_engine.process_message(image_data, is_image=True)
+        await dispatch_intent(update, context, intent_data, extracted_info, processing_message,
+                              "I couldn't detect an event in the image.")
     except Exception as e:
         logger.error(f"Error processing image: {e}", exc_info=True)
-        await processing_message.delete()
-        await update.message.reply_text("Sorry, an error occurred while processing your image.")
+        await processing_message.edit_text("Sorry, an error occurred while processing your image.")
+
+# Everything dispatch_message knows how to process
+MESSAGE_FILTER = (filters.TEXT & ~filters.COMMAND) | filters.PHOTO | filters.VOICE
+
+async def dispatch_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Routes a message that passed MESSAGE_FILTER to the photo, voice or text processor."""
+    message = update.message
+    if message.photo:
+        await process_image(update, context)
+    elif message.voice:
+        await process_audio(update, context)
+    else:
+        await process_text(update, context)
 
 async def handle_add_event(update: Update, context: ContextTypes.DEFAULT_TYPE, event_data: Dict[str, Any], processing_message: Any) -> None:
     user_id = str(update.effective_user.id)
+    summary = event_data.get('summary')
+    start_time = event_data.get('start_time')
     
-    if not event_data.get('summary') or not event_data.get('start_time'):
-        await update.message.reply_text("I need more information. Please specify at least a title and a date/time.")
-        await processing_message.delete()
+    if not summary or not start_time:
+        await processing_message.edit_text("I need more information. Please specify at least a title and a date/time.")
         return
 
-    creds = database.get_creds(user_id)
+    creds = await asyncio.to_thread(database.get_creds, user_id)
     if not creds:
-        await update.message.reply_text(
+        await processing_message.edit_text(
             "Your calendar is not connected. Please use the /connect command to authorize me."
         )
-        await processing_message.delete()
         return
 
     await processing_message.edit_text("Creating event in your Google Calendar...")
 
     try:
-        result = create_event_with_creds(creds, event_data, user_id)
+        result = await create_event_async(creds, event_data, user_id)
         if result and result.get("success"):
-            event_details = (
-                f"📅 *{event_data.get('summary')}*\n"
-                f"📆 {event_data.get('start_time')}\n"
-            )
-            keyboard = [[InlineKeyboardButton("View Event in Google Calendar", url=result.get('event_link'))]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                f"Event created successfully!\n\n{event_details}",
+            reply_markup = link_keyboard(VIEW_EVENT_BUTTON_LABEL, result.get('event_link'))
+            await processing_message.edit_text(
+                f"Event created successfully!\n\n📅 *{summary}*\n📆 {start_time}\n",
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
             )
         else:
-            await update.message.reply_text(f"Could not create the event. Error: {result.get('message')}")
+            await processing_message.edit_text(f"Could not create the event. Error: {result.get('message')}")
     except Exception as e:
         logger.error(f"Failed to create event for user {user_id}: {e}")
-        await update.message.reply_text("An unexpected error occurred while creating the event in your calendar.")
-    
-    await processing_message.delete()
+        await processing_message.edit_text("An unexpected error occurred while creating the event in your calendar.")
+
+async def handle_greet(update: Update, context: ContextTypes.DEFAULT_TYPE, event_data: Dict[str, Any], processing_message: Any) -> None:
+    await processing_message.edit_text(
+        f"Hello {update.effective_user.first_name}! Tell me about an event and I'll add it to your calendar."
+    )
+
+async def handle_help(update: Update, context: ContextTypes.DEFAULT_TYPE, event_data: Dict[str, Any], processing_message: Any) -> None:
+    await processing_message.edit_text(HELP_TEXT)
+
+# Intent -> handler; every handler takes (update, context, extracted_info, processing_message)
+INTENT_HANDLERS = {
+    'add_event': handle_add_event,
+    'greet': handle_greet,
+    'help': handle_help,
+}
+
+async def dispatch_intent(update: Update, context: ContextTypes.DEFAULT_TYPE, intent_data: Dict[str, Any],
+                          extracted_info: Dict[str, Any], processing_message: Any, unknown_text: str) -> None:
+    """Runs the handler for the detected intent, or shows unknown_text when there is none."""
+    handler = INTENT_HANDLERS.get(intent_data.get('intent'))
+    if handler:
+        await handler(update, context, extracted_info, processing_message)
+    else:
+        await processing_message.edit_text(unknown_text)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the user."""
@@ -296,21 +340,47 @@ async def telegram_webhook_handler(request: web.Request) -> web.Response:
     """Handles incoming Telegram updates by parsing them and passing them to the application."""
     application = request.app['bot_app']
     try:
-        data = await request.json()
+        data = orjson.loads(await request.read())
         update = Update.de_json(data, application.bot)
-        await application.process_update(update)
+        # Acknowledge right away; the application's update fetcher runs the handlers, so
+        # Telegram's webhook timeout no longer depends on how long Mistral takes
+        await application.update_queue.put(update)
         return web.Response()
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         logger.warning("Received invalid JSON in webhook")
         return web.Response(status=400)
     except Exception as e:
         logger.error(f"Error in webhook handler: {e}", exc_info=True)
         return web.Response(status=500)
 
+def prepare_whisper() -> None:
+    """Loads Whisper and runs a dummy inference; blocking, call off the event loop."""
+    if audio_processor.load_model(WHISPER_MODEL_SIZE):
+        audio_processor.warmup()
+
+async def warmup(application: Application) -> None:
+    """Loads Whisper, restores the semantic cache and opens the Mistral connection concurrently."""
+    oauth_states.start_pruning()
+    tasks = [asyncio.to_thread(prepare_whisper), mistral_engine.warmup()]
+    if isinstance(mistral_engine, CachingMistralEngine):
+        tasks.append(asyncio.to_thread(mistral_engine.load_persisted_cache))
+    await asyncio.gather(*tasks)
+
+async def post_shutdown(application: Application) -> None:
+    """Releases the pooled Mistral, Calendar and Redis connections."""
+    # Queued messages still need the HTTP client, so drain the batcher first
+    await mistral_engine.close()
+    await close_http_client()
+    await oauth_states.close()
+    await asyncio.to_thread(database.close_creds_invalidation)
+
 def create_application() -> Application:
     """Creates and configures the Telegram bot application."""
     builder = Application.builder().token(TELEGRAM_TOKEN)
     builder.pool_timeout(3600).get_updates_pool_timeout(3600)
+    # Handle up to this many updates at once instead of one after another
+    builder.concurrent_updates(CONCURRENT_UPDATES)
+    builder.post_init(warmup).post_shutdown(post_shutdown)
     application = builder.build()
     
     # Command handlers
@@ -320,10 +390,8 @@ def create_application() -> Application:
     application.add_handler(CommandHandler("disconnect", disconnect_command))
     application.add_handler(CommandHandler("status", status_command))
     
-    # Message handlers
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_text))
-    application.add_handler(MessageHandler(filters.PHOTO, process_image))
-    application.add_handler(MessageHandler(filters.VOICE, process_audio))
+    # One message handler; dispatch_message picks the processor from the message content
+    application.add_handler(MessageHandler(MESSAGE_FILTER, dispatch_message))
     
     # Error handler
     application.add_error_handler(error_handler)
@@ -334,12 +402,11 @@ async def main() -> None:
     """Initializes the bot and starts the webserver or polling."""
     application = create_application()
     
-    APP_URL = os.environ.get('APP_URL')
     if APP_URL:
         # --- Production Mode (Webhook) ---
-        PORT = int(os.environ.get('PORT', 8080))
-        
         await application.initialize()
+        # post_init is only invoked by run_polling/run_webhook, so warm up here
+        await warmup(application)
         await application.bot.set_webhook(
             url=f"{APP_URL}/{TELEGRAM_TOKEN}",
             allowed_updates=Update.ALL_TYPES
@@ -356,7 +423,9 @@ async def main() -> None:
         # Start the web server
         runner = web.AppRunner(web_app)
         await runner.setup()
-        site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
+        # Deeper accept queue for webhook bursts. reuse_port lets several workers share PORT, so it
+        # is only set when they are configured; otherwise a duplicate launch fails to bind loudly
+        site = web.TCPSite(runner, host="0.0.0.0", port=PORT, backlog=512, reuse_port=WEB_WORKERS > 1 or None)
         await site.start()
         
         logger.info(f"Web server started on port {PORT}")
@@ -364,8 +433,15 @@ async def main() -> None:
         await application.start()
         
         # Keep the script running
-        while True:
-            await asyncio.sleep(3600)
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            # post_shutdown is only invoked by run_polling/run_webhook, so call it here
+            await application.stop()
+            await application.shutdown()
+            await post_shutdown(application)
+            await runner.cleanup()
             
     else:
         # --- Development Mode (Polling) ---
@@ -373,4 +449,10 @@ async def main() -> None:
         await application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
+    try:
+        # libuv-based loop: cheaper scheduling and socket callbacks for the webhook server
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop.")
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,74 @@
+import asyncio
+import datetime
+from unittest import mock
+
+import httpx
+from google.oauth2.credentials import Credentials
+
+from src import calendar_events
+
+EVENT_DATA = {
+    "summary": "Dentist",
+    "start_time": "2025-06-02T10:00:00",
+    "end_time": "2025-06-02T11:00:00",
+}
+
+def _response(status_code, content=b"{}"):
+    request = httpx.Request("POST", calendar_events.CALENDAR_EVENTS_URL)
+    return httpx.Response(status_code, content=content, request=request)
+
+def _refresh(creds, _request):
+    creds.token = "fresh-token"
+
+def test_create_event_refreshes_and_retries_on_401():
+    # Credentials restored without an expiry look valid, so only Google's 401 reveals the stale token
+    creds = Credentials("stale-token", refresh_token="refresh", token_uri="https://oauth2.googleapis.com/token",
+                        client_id="id", client_secret="secret")
+    post = mock.AsyncMock(side_effect=[
+        _response(401),
+        _response(200, b'{"id": "evt1", "htmlLink": "https://calendar.google.com/evt1"}'),
+    ])
+    
+    with mock.patch.object(calendar_events.HTTP_CLIENT, "post", post), \
+         mock.patch.object(Credentials, "refresh", autospec=True, side_effect=_refresh), \
+         mock.patch.object(calendar_events.database, "save_creds") as save_creds:
+        result = asyncio.run(calendar_events.create_event_async(creds, EVENT_DATA, "42"))
+    
+    assert result == {
+        "success": True,
+        "message": "Event created successfully.",
+        "event_id": "evt1",
+        "event_link": "https://calendar.google.com/evt1",
+    }
+    assert post.await_count == 2
+    assert post.await_args_list[1].kwargs["headers"]["Authorization"] == "Bearer fresh-token"
+    save_creds.assert_called_once_with("42", creds)
+
+def test_create_event_gives_up_after_second_401():
+    creds = Credentials("stale-token", refresh_token="refresh", token_uri="https://oauth2.googleapis.com/token",
+                        client_id="id", client_secret="secret")
+    post = mock.AsyncMock(side_effect=[_response(401), _response(401)])
+    
+    with mock.patch.object(calendar_events.HTTP_CLIENT, "post", post), \
+         mock.patch.object(Credentials, "refresh", autospec=True, side_effect=_refresh), \
+         mock.patch.object(calendar_events.database, "save_creds"):
+        result = asyncio.run(calendar_events.create_event_async(creds, EVENT_DATA, "42"))
+    
+    assert result["success"] is False
+    assert post.await_count == 2
+
+def test_create_event_refreshes_expired_creds_before_inserting():
+    creds = Credentials("stale-token", refresh_token="refresh", token_uri="https://oauth2.googleapis.com/token",
+                        client_id="id", client_secret="secret",
+                        expiry=datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
+    post = mock.AsyncMock(return_value=_response(200, b'{"id": "evt1"}'))
+    
+    with mock.patch.object(calendar_events.HTTP_CLIENT, "post", post), \
+         mock.patch.object(Credentials, "refresh", autospec=True, side_effect=_refresh), \
+         mock.patch.object(calendar_events.database, "save_creds") as save_creds:
+        result = asyncio.run(calendar_events.create_event_async(creds, EVENT_DATA, "42"))
+    
+    assert result["success"] is True
+    post.assert_awaited_once()
+    assert post.await_args.kwargs["headers"]["Authorization"] == "Bearer fresh-token"
+    save_creds.assert_called_once_with("42", creds)
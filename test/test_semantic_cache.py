@@ -0,0 +1,32 @@
+from src.semantic_cache import SemanticCache
+
+# Paraphrases that only differ in their entities embed almost identically
+EMBEDDING = [0.6, 0.8, 0.0]
+NEAR_EMBEDDING = [0.6, 0.79, 0.01]
+
+def _add_event(summary, start_time):
+    intent = {'intent': 'add_event', 'confidence': 0.95, 'explanation': 'Wants a meeting'}
+    event = {'summary': summary, 'start_time': start_time, 'confidence': 0.9}
+    return intent, event
+
+def test_event_paraphrases_do_not_share_a_result():
+    cache = SemanticCache(threshold=0.92)
+    intent, event = _add_event("Reunión con Juan", "2025-06-02T10:00:00")
+    cache.store("reunión con Juan el lunes a las 10", EMBEDDING, intent, event)
+    
+    assert cache.lookup("reunión con Pedro el martes a las 10", NEAR_EMBEDDING) is None
+    assert cache.lookup("reunión con Juan pasado mañana a las 10", NEAR_EMBEDDING) is None
+
+def test_event_result_still_served_on_exact_match():
+    cache = SemanticCache(threshold=0.92)
+    intent, event = _add_event("Reunión con Juan", "2025-06-02T10:00:00")
+    cache.store("reunión con Juan el lunes a las 10", EMBEDDING, intent, event)
+    
+    assert cache.get("Reunión con Juan el lunes  a las 10") == (intent, event)
+
+def test_entity_free_paraphrases_share_a_result():
+    cache = SemanticCache(threshold=0.92)
+    intent = {'intent': 'other', 'confidence': 0.8, 'explanation': 'Small talk'}
+    cache.store("what's the weather like", EMBEDDING, intent, {})
+    
+    assert cache.lookup("how is the weather", NEAR_EMBEDDING) == (intent, {})